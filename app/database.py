@@ -7,30 +7,47 @@ Define a relational database.
 Define an engine and a session function binded to it.
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, Enum, DateTime, ForeignKey, func
-from sqlalchemy.orm import sessionmaker, relationship, Session, DeclarativeBase, Mapped, mapped_column
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, Enum, DateTime, ForeignKey, func
+from sqlalchemy.orm import sessionmaker, relationship, DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from enum import Enum as PyEnum
 from sqlalchemy.orm import validates
 from datetime import datetime as dt
 from typing import List, Optional
+from settings import get_settings
 
 
 # Default database URL created on related volume
 SQLALCHEMY_DATABASE_URL = "sqlite:///./users.db"
 
 # Create a sqlalchemy engine which we will use as the basis for all our db calls
+# SQL statements are only logged when SQL_ECHO=1 in the environment or the .env file (debugging purpose)
+# Compiled statements are kept in an LRU cache so that repeated queries are not recompiled
+# Each session checks out its own pooled connection (default pool): sessions never share a transaction
 try:
     engine = create_engine(
         SQLALCHEMY_DATABASE_URL, 
         connect_args={"check_same_thread": False},
-        echo=True
+        echo=get_settings().sql_echo,
+        query_cache_size=1200,
+        future=True
         )
 except SQLAlchemyError() as e:
     print(f"Database connection error: {e}")
     raise e
 
+# Tune SQLite when connecting: WAL journal lets readers on other connections work while a writer commits,
+# and a larger in-memory page cache limits disk reads.
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
 # Use class standard to create tables and their related objects at once
 # Base = declarative_base()
 
@@ -54,27 +71,18 @@ class Role(PyEnum):
 class User(Base):
     __tablename__ = "users"
     id = mapped_column(Integer, primary_key=True, nullable=False)
-    username: Mapped[str] = mapped_column(String(100))
+    username: Mapped[str] = mapped_column(String(100), index=True, unique=True)
     nickname: Mapped[Optional[str]] = mapped_column(String(50))
     email: Mapped[str] = mapped_column(String(100), unique=True, index=True)
     hashed_password: Mapped[str] = mapped_column(String(200))
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
     role: Mapped[Role] = mapped_column(Enum(Role))
     timestamp: Mapped[dt] = mapped_column(insert_default = func.now())  # Datetime of recording
-    
-    __mapper_args__ = {
-        'version_id_col': timestamp,
-        'version_id_generator': lambda v:dt.now(),
-                }
 
     password: Mapped[List["Password"]] = relationship(back_populates="user", 
                                                       uselist=False)
 
-    # Set constraint on email
-    @validates('email')
-    def validate_email(self, key, email):
-        assert '@' in email, "Email address must contain @"
-        return email
+    # E-mail format is checked upstream by Pydantic (EmailStr) in models.py
     
     # Set constraint on username minimum size
     @validates('username')
@@ -100,11 +108,18 @@ class Password(Base):
 # Build tables
 Base.metadata.create_all(engine)
 
+# create_all does not alter existing tables: make sure databases created before
+# username became unique get their unique index as well.
+try:
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)")
+except SQLAlchemyError as e:
+    print(f"Unable to create unique index on users.username: {e}")
+
 # Use a parametrized connection for any calls and bind it with engine
 # sessionmaker is more structured than session (from sqlalchemy.orm)
 # Connect to the local database
 SessionLocal  = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-session = Session(bind=engine)
 
 #######################################################################
 # CONNECT TO DATABASE
@@ -2,12 +2,73 @@
 Module to interact with database : create, update, delete, get a user, get all database users
 """
 
-from sqlalchemy.orm import Session
-from sqlalchemy import exc
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import exc, select, insert, bindparam, or_, Integer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import database, models
 from fastapi import HTTPException
-from security_center import check_password, hash_password, create_access_token 
-from datetime import datetime as dt
+from security_center import check_password, hash_password, create_access_token, forget_user_tokens
+from collections import namedtuple
+from cachetools import TTLCache
+import threading
+
+# Number of users sent per multi-row INSERT when importing users
+BULK_INSERT_BATCH_SIZE = 1000
+
+# Statements built once and reused so that SQLAlchemy serves them from its compiled cache
+# A user identifier is either its id or its username: both are searched at once, id match first
+_ID_PARAM = bindparam("id_", type_=Integer)
+_USER_BY_IDENTIFIER_STMT = select(database.User).where(
+    or_(database.User.id == _ID_PARAM, database.User.username == bindparam("uname"))
+).order_by((database.User.id == _ID_PARAM).desc()).limit(1)
+# Deleting a user detaches its password row: load both in one statement
+_USER_WITH_PASSWORD_BY_IDENTIFIER_STMT = _USER_BY_IDENTIFIER_STMT.options(joinedload(database.User.password))
+_USERS_BY_NAME_STMT = select(
+    database.User.id,
+    database.User.username,
+    database.User.nickname,
+    database.User.email,
+    database.User.hashed_password,
+    database.User.is_active,
+    database.User.role
+).where(database.User.username == bindparam("u")).limit(2)
+# Plain columns (no ORM entities) to list users without identity map overhead
+_ALL_USERS_STMT = select(
+    database.User.id,
+    database.User.username,
+    database.User.nickname,
+    database.User.email,
+    database.User.hashed_password,
+    database.User.is_active,
+    database.User.role,
+    database.User.timestamp
+)
+
+# Detached copy of a user row, safe to share between requests and sessions
+UserSnapshot = namedtuple("UserSnapshot", ["id", "username", "nickname", "email", "hashed_password", "is_active", "role"])
+
+# Users recently grasped by get_user, by username, to avoid a database round trip per authenticated request.
+# LIMIT: the cache lives in each worker process and _forget_user only evicts it in the current one. With
+# several uvicorn workers, a deleted user or a changed password keeps authenticating on the other workers
+# until the entry expires: USERS_CACHE_TTL bounds that delay.
+USERS_CACHE_TTL = 10
+_users_cache = TTLCache(maxsize=1024, ttl=USERS_CACHE_TTL)
+_users_cache_lock = threading.Lock()
+
+
+def _forget_user(username: str):
+    """
+    Remove a user from the get_user cache (after it has been updated or deleted).
+    """
+    with _users_cache_lock:
+        _users_cache.pop(username, None)
+
+
+def _identifier_params(identifier: str):
+    """
+    Bind parameters of the user identifier statements (ids are positive, -1 never matches).
+    """
+    return {"id_": int(identifier) if identifier.isdigit() else -1, "uname": identifier}
 
 
 def create_user(db: Session, user: models.userCreateInDB):
@@ -19,29 +80,30 @@ def create_user(db: Session, user: models.userCreateInDB):
         - user (models.userCreateInDB) : user to be created in DB and following userCreateInDB model.
     
     RETURN: 
-        models.userCreateInDB: Instance of the created user in the DB.
+        database.User: Instance of the created user in the DB.
     
     RAISE EXCEPTION: HTTPException
         Status 400 for a username conflict or validation problem.
         Status 500 for an error from the database.
     """
-    # Hash the given password
-    hashed_password = hash_password(user.password)
-
-    new_user = models.userCreateInDB(
-        username = user.username,
-        #nickname = if user.nickname != '':
-        #    user.nickname,
+    # Single INSERT that silently skips rows conflicting with a unique username or e-mail
+    stmt = sqlite_insert(database.User).values(
+        username=user.username,
+        nickname=user.nickname,
         email=user.email,
-        hashed_password=hashed_password,
+        hashed_password=hash_password(user.password),
         is_active=True,
         role=user.role
-    )
-    db.add(new_user)
+    ).on_conflict_do_nothing().returning(database.User)
     try:
+        new_user = db.execute(stmt).scalar_one_or_none()
+        if new_user is None:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="This e-mail or username already exist")
         db.commit()
-        db.refresh(new_user)
         return new_user
+    except HTTPException:
+        raise
     except exc.IntegrityError:
         db.rollback()
         raise HTTPException(status_code=400, detail="This e-mail or username already exist")
@@ -50,6 +112,64 @@ def create_user(db: Session, user: models.userCreateInDB):
         raise HTTPException(status_code=500, detail=f"Error when creating user.: {str(e)}")
     
 
+def bulk_create_users(db: Session, users: list[models.userCreateInDB]):
+    """
+    Create/commit several users at once: rows are inserted by batches and committed in a single transaction.
+
+    ARGS: 
+        - db (Session) : Database Session
+        - users (list[models.userCreateInDB]) : users to be created in DB and following userCreateInDB model.
+    
+    RETURN: list[int]
+        Primary keys of the created users.
+    
+    RAISE EXCEPTION: HTTPException
+        Status 400 for a username conflict or validation problem.
+        Status 500 for an error from the database.
+    """
+    rows = [
+        {
+            "username": user.username,
+            "nickname": user.nickname,
+            "email": user.email,
+            "hashed_password": hash_password(user.password),
+            "is_active": True,
+            "role": user.role
+        }
+        for user in users
+    ]
+    stmt = insert(database.User).returning(database.User.id)
+    try:
+        ids = []
+        for start in range(0, len(rows), BULK_INSERT_BATCH_SIZE):
+            ids.extend(db.scalars(stmt, rows[start:start + BULK_INSERT_BATCH_SIZE]).all())
+        db.commit()
+        return ids
+    except exc.IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="An e-mail or username already exist")
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error when creating users.: {str(e)}")
+
+
+def find_user(db: Session, username: str):
+    """
+    Retrieve a user with its username only, without checking any password.
+
+    ARGS:
+        - db: Session
+            The database session. 
+        - username: str
+            The searched username.
+
+    RETURN: UserSnapshot
+        The researched user grasped in the database (None if not found).
+    """
+    row = db.execute(_USERS_BY_NAME_STMT, {"u": username}).first()
+    return UserSnapshot(*row) if row is not None else None
+
+
 def get_user(db: Session, username: str, password: str, raise_exception: bool = True):
     """
     Retrieve a user with its username and password (this couple is unique).
@@ -62,82 +182,98 @@ def get_user(db: Session, username: str, password: str, raise_exception: bool =
         - password: str
             The user's password
 
-    RETURN: models.userInDB
-        The researched user grasped in the database.
+    RETURN: UserSnapshot
+        The researched user grasped in the database or in cache (None if not found and raise_exception is False).
 
     RAISE EXCEPTION: HTTPException
-        Status 400 for an unknown user.
+        Status 404 for an unknown user or a wrong password.
+        Status 500 if several users share the same username.
     """
-    # Query the user in table User
-    user = db.query(database.User).filter(database.User.username == username, 
-                                          database.User.hashed_password == hash_password(password))  # .first()
-    if user is None and raise_exception:
-        raise HTTPException(status_code=404, detail="User not found")
-    if len(user) > 1:
-        raise HTTPException(status=404, details="More than one user found with the same username and password")
-    return user
+    with _users_cache_lock:
+        users = _users_cache.get(username)
+    if users is None:
+        # Query the user in table User in a single round trip (2 rows are enough to detect duplicates)
+        users = [UserSnapshot(*row) for row in db.execute(_USERS_BY_NAME_STMT, {"u": username})]
+        if users:
+            with _users_cache_lock:
+                _users_cache[username] = users
+    # Passwords are salted: they can only be compared once the stored hash is retrieved
+    users = [user for user in users if check_password(password, user.hashed_password)]
+    if not users:
+        if raise_exception:
+            raise HTTPException(status_code=404, detail="User not found")
+        return None
+    if len(users) > 1:
+        raise HTTPException(status_code=500, detail="More than one user found with the same username and password")
+    return users[0]
 
 
 def get_all_users(db: Session, raise_exception: bool = True):
     """
-    List all users contained in the database with a username.
+    List all users contained in the database.
 
         ARGS:
         - db: Session
             The database session. 
+        - raise_exception: bool
+            Raise an error if the database contains no user (an empty dict is returned otherwise).
 
     RETURN: dict
         The list of users with their details listed by primary key (dic key either).
 
     RAISE EXCEPTION: HTTPException
-        Status 400 if unknown user.
+        Status 404 if the database contains no user.
     """
 
     # Query table User
-    users = db.query(database.User).filter(database.User.username != '')  # .first()
-    if users is None and raise_exception:
+    users = db.execute(_ALL_USERS_STMT).all()
+    if not users and raise_exception:
         raise HTTPException(status_code=404, detail="Not any user in the database")
-    resp = {}
-    for user in users:
-        resp[user.id] = {
+    resp = {
+        user.id: {
             "username": user.username,
             "nickname": user.nickname, 
             "email": user.email,
             "hashed_password": user.hashed_password,
             "is_active": user.is_active,
             "role": user.role,
-            "timestamp": dt.strftime(user.timestamp,"%Y-%m-%d, %H:%M:%S")
+            "timestamp": user.timestamp.isoformat(sep=" ", timespec="seconds")
         }
+        for user in users
+    }
     return resp
 
 
 def update_user(db: Session, identifier: str, user_update: models.userUpdateInDB):
     """
-    Update an existing user in the database based on its id in table User.
+    Update an existing user in the database based on its id in table User or its username.
     
     ARGS:
         - db: Session
             The database session. 
         - identifier: str
-            The id: primary key of the user in table User.
+            The id (primary key of the user in table User) or the username.
+        - user_update: models.userUpdateInDB
+            The user details to change (details left unset are kept).
     RETURN: dict
-        Updated user details.
+        Updated user details (without any password).
 
     RAISE EXCEPTION: HTTPException
-        Status 400 if unknown user.
+        Status 404 if unknown user.
         Status 500 if database updating error.
 
     """
-    if identifier.isdigit():  
-        user = db.query(database.User).filter(database.User.id == int(identifier)).first()
-    else:
-        user = db.query(database.User).filter(database.User.username == identifier).first()
+    user = db.execute(_USER_BY_IDENTIFIER_STMT, _identifier_params(identifier)).scalar_one_or_none()
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    cached_username, cached_user_id = user.username, user.id
 
     # Get user updated data in dictionnary format
     update_data = user_update.model_dump(exclude_unset=True) # model_dump() -> {}
+    # A new password is stored hashed (User.password is the plain password table relationship)
+    if "password" in update_data:
+        update_data["hashed_password"] = hash_password(update_data.pop("password"))
     
     # Add modification of user in database by setting attributes (key, value) to the user.
     for key, value in update_data.items():
@@ -145,8 +281,10 @@ def update_user(db: Session, identifier: str, user_update: models.userUpdateInDB
     # Commit database    
     try:
         db.commit()
+        _forget_user(cached_username)
+        forget_user_tokens(cached_user_id)
         db.refresh(user)
-        return user.model_dump(exclude_unset=True)
+        return models.userOut.model_validate(user).model_dump()
     except:
         db.rollback()
         raise HTTPException(status_code=500, detail="Error when updating user.")
@@ -154,33 +292,35 @@ def update_user(db: Session, identifier: str, user_update: models.userUpdateInDB
 
 def delete_user(db: Session, identifier: str):
     """
-    Delete an existing user in the database based on its id in table User.
+    Delete an existing user in the database based on its id in table User or its username.
     
     ARGS:
         - db: Session
             The database session. 
         - identifier: str
-            The id: primary key of the user in table User.
+            The id (primary key of the user in table User) or the username.
     RETURN: dict
-        Updated user details.
+        Deleted user details (without any password).
 
     RAISE EXCEPTION: HTTPException
-        Status 400 if unknown user.
+        Status 404 if unknown user.
         Status 500 if database updating error.
 
     """
-    if identifier.isdigit():
-        user = db.query(database.User).filter(database.User.id == int(identifier)).first()
-    else:
-        user = db.query(database.User).filter(database.User.username == identifier).first()
+    user = db.execute(_USER_WITH_PASSWORD_BY_IDENTIFIER_STMT, _identifier_params(identifier)).unique().scalar_one_or_none()
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    cached_username, cached_user_id = user.username, user.id
+    # Serialize the user while it can still be read (a deleted instance is not reloaded after commit)
+    deleted_user = models.userOut.model_validate(user).model_dump()
 
     try:
         db.delete(user)
         db.commit()
-        return {"user": user.model_dump(exclude_unset=True), "detail": "User deleted"}
+        _forget_user(cached_username)
+        forget_user_tokens(cached_user_id)
+        return {"user": deleted_user, "detail": "User deleted"}
     except:
         db.rollback()
         raise HTTPException(status_code=500, detail="Error when deleting user.")
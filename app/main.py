@@ -18,16 +18,16 @@ import os
 sys.path.append(str(Path(__name__).resolve().parent.parent))
 
 from contextlib import asynccontextmanager
-from dotenv import load_dotenv
+from settings import get_settings
 from router import users_router
 from fastapi import FastAPI
-from security_center import check_password, hash_password
+from security_center import check_password, hash_password, get_user_with_token
 import database
 from datetime import datetime as dt, timedelta
 import db_tools
 import models
 from sqlalchemy.exc import OperationalError
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, File, Form, UploadFile
 from sqlalchemy.orm import Session
@@ -35,16 +35,42 @@ import security_center
 from src.data import import_raw_data, make_dataset
 from src.models import train_model, predict_model
 import json
+import numpy as np
 import pandas as pd
 import shutil
-
-# Load .env file variables to the current working environement.
-load_dotenv()
+import logging
+from logging.handlers import RotatingFileHandler
 
 # Grasp environment variables from .env file 
-ADMIN_USERNAME = os.getenv("ADMIN_USERNAME")
-ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
-ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+ADMIN_USERNAME = get_settings().admin_username
+ADMIN_EMAIL = get_settings().admin_email
+ADMIN_PASSWORD = get_settings().admin_password
+
+# Application events logger (buffered by the logging module, file rotated every 5 MB)
+logger = logging.getLogger("app")
+logger.setLevel(logging.INFO)
+logger.addHandler(RotatingFileHandler("log.txt", maxBytes=5_000_000, backupCount=3))
+
+# Test set used by /accuracy, parsed once and reloaded only when the csv files change
+X_TEST_PATH = Path('data/preprocessed/X_test.csv')
+Y_TEST_PATH = Path('data/preprocessed/y_test.csv')
+_test_set_cache = {"mtimes": None, "X_test": None, "y_test": None}
+
+def load_test_set():
+    """
+    Get X_test (float32 columns) and y_test, parsing the csv files only if they changed since last call.
+
+    X_test stays a DataFrame so that the model receives the feature names it was fitted with.
+
+    RETURN: tuple
+        (X_test, y_test): DataFrame and numpy array.
+    """
+    mtimes = (X_TEST_PATH.stat().st_mtime_ns, Y_TEST_PATH.stat().st_mtime_ns)
+    if _test_set_cache["mtimes"] != mtimes:
+        _test_set_cache["X_test"] = pd.read_csv(X_TEST_PATH).astype(np.float32)
+        _test_set_cache["y_test"] = pd.read_csv(Y_TEST_PATH).to_numpy(dtype=np.float32).ravel()
+        _test_set_cache["mtimes"] = mtimes
+    return _test_set_cache["X_test"], _test_set_cache["y_test"]
 
 # Create an API cartography
 tags_metadata = [
@@ -73,23 +99,26 @@ async def lifespan(api: FastAPI):
     """
     # Write the opening time in log
     startup_time = dt.strftime(dt.today(),"%Y-%m-%d, %H:%M:%S")
-    with open("log.txt", mode="a") as log:
-        log.write(f"Application starts up at: {startup_time}") 
+    logger.info("Application starts up at: %s", startup_time)
 
     # Connect to database
     db = database.SessionLocal() 
     database.Base.metadata.create_all(bind=database.engine)
 
     try:
-        admin_user = db_tools.get_user(db, username=ADMIN_USERNAME, password=ADMIN_PASSWORD, raise_exception=False)
-        if not admin_user:
+        admin_user = db_tools.find_user(db, username=ADMIN_USERNAME)
+        if admin_user is None:
             user_in = models.userNew(
                 username=ADMIN_USERNAME, 
+                nickname=ADMIN_USERNAME,
                 password=ADMIN_PASSWORD,
                 email=ADMIN_EMAIL, 
                 role=database.Role.admin
             )
             db_tools.create_user(db=db, user=user_in)
+        elif not check_password(ADMIN_PASSWORD, admin_user.hashed_password):
+            # Keep the stored account: its password is not overwritten from the environment
+            logger.warning("Admin user %s already exists with a password different from ADMIN_PASSWORD.", ADMIN_USERNAME)
         else:
             print("Admin user already exists.")
     except OperationalError as e:
@@ -104,13 +133,14 @@ async def lifespan(api: FastAPI):
     Then close application and write the log
     """
     shutdown_time = dt.strftime(dt.today(),"%Y-%m-%d, %H:%M:%S")
-    with open("log.txt", mode="a") as log:
-        log.write(f"Application shuts down at: {startup_time}") 
+    logger.info("Application shuts down at: %s", shutdown_time)
 
 
 # API initialization
+# JSON responses are serialized with orjson
 api = FastAPI(
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     title="Car accidents API",
     description="My Car Accidents prediction using an API.",
     version="1.1",
@@ -155,7 +185,7 @@ def home():
 
 # Get a token if the user is registered into the database
 @api.post("/token", tags=["User management"])
-async def token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.query_db)):
+def token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.query_db)):
     user = db_tools.get_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
@@ -167,7 +197,7 @@ async def token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
 
 # Import raw data from AWS s3 in ./data/raw
 @api.post("/raw", tags=["Data management"])
-async def import_data(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.query_db)):
+def import_data(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.query_db)):
     user = db_tools.get_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
@@ -176,7 +206,7 @@ async def import_data(form_data: OAuth2PasswordRequestForm = Depends(), db: Sess
 
 # Build a dataset from ./data/raw to ./data/preprocessed where the user can enter a file path
 @api.post("/dataset", tags=["Data management"])
-async def build_dataset(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.query_db)):
+def build_dataset(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.query_db)):
     user = db_tools.get_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
@@ -185,21 +215,24 @@ async def build_dataset(form_data: OAuth2PasswordRequestForm = Depends(), db: Se
 
 # Train a model and save it on ./src/models
 @api.post("/train", tags=["Model features"])
-async def train(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.query_db)):
+def train(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.query_db)):
     user = db_tools.get_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     train_model.train()
     print("Model has been trained with success been saved in folder: ./src/models")
 
+    # Serve predictions (and accuracy) with the new model
+    predict_model.loaded_model = predict_model.load_model()
+
 # Make a prediction based on features file given by user (file_to_load_path as a json file) or not (in that case, he must fill up features manually).
 # If no path provided then the user can enter features manually.
-api.post("/prediction/{file_to_load_path}", tags=["Model features"])
-async def predict(file_to_load_path: str,
-                  db: Session = Depends(database.query_db),
-                  user: models.userInDB = Depends(get_user_with_token)):
+@api.post("/prediction/{file_to_load_path}", tags=["Model features"])
+def predict(file_to_load_path: str,
+            db: Session = Depends(database.query_db),
+            user: models.userInDB = Depends(get_user_with_token)):
     # Check that user is Admin
-    if user.role not in [db_models.Role.admin]:
+    if user.role not in [database.Role.admin]:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied. Only Admin has access.")
       
     # If any file path is provided by user => he has to enter feature values manually
@@ -216,13 +249,13 @@ async def predict(file_to_load_path: str,
         except Exception as e:
             raise HTTPException(status_code=404, detail=f"Unable to load features from provided file path: {str(e)}")
           
-    # Compute prediction on provided features
-    return {"prediction": predict_model.predict_model(features)}
+    # Compute prediction on provided features (numpy array serialized as is by ORJSONResponse)
+    return ORJSONResponse({"prediction": predict_model.predict_model(features)})
 
 
 # Get accuracy of the current model 
 @api.get("/accuracy", tags=["Model features"])
-async def model_accuracy(form_data: OAuth2PasswordRequestForm = Depends(),db: Session = Depends(database.query_db)):
+def model_accuracy(form_data: OAuth2PasswordRequestForm = Depends(),db: Session = Depends(database.query_db)):
     user = db_tools.get_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
@@ -230,8 +263,7 @@ async def model_accuracy(form_data: OAuth2PasswordRequestForm = Depends(),db: Se
     loaded_model = predict_model.loaded_model
     
     try:
-        X_test = pd.read_csv('data/preprocessed/X_test.csv')
-        y_test = pd.read_csv('data/preprocessed/y_test.csv')
+        X_test, y_test = load_test_set()
         return {"accuracy": loaded_model.score(X_test, y_test)}
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"X_test or y_test are not available in data/preprocessed/ with Error: {str(e)}")
@@ -239,7 +271,7 @@ async def model_accuracy(form_data: OAuth2PasswordRequestForm = Depends(),db: Se
 
 # Save current model as a backup
 @api.post("/backup", tags=["Model features"])
-async def backup(form_data: OAuth2PasswordRequestForm = Depends(),db: Session = Depends(database.query_db)):
+def backup(form_data: OAuth2PasswordRequestForm = Depends(),db: Session = Depends(database.query_db)):
     user = db_tools.get_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
@@ -253,22 +285,44 @@ async def backup(form_data: OAuth2PasswordRequestForm = Depends(),db: Session =
     destination_dir = Path(f'./src/models/archives/archive -{datetime_now}')
     destination_dir.mkdir(parents=True, exist_ok=True)
 
-    # Save in destination directory
-    shutil.copy(source_dir, destination_dir)
+    # Save in destination directory: a hard link costs no copy (the model file is replaced, never rewritten, on training)
+    # Fall back on a real copy if linking is not possible (other device, unsupported file system...)
+    try:
+        os.link(source_dir, destination_dir / source_dir.name)
+    except OSError:
+        shutil.copy2(source_dir, destination_dir)
+
+    # Name of the archive: give it back to /reverse_backup to restore this very model
+    return {"archive": destination_dir.name}
 
-# Unsave current model and retrieve current model
+# Unsave current model and retrieve the archived one (the given archive, or the latest one otherwise)
 @api.post("/reverse_backup", tags=["Model features"])
-async def backup(form_data: OAuth2PasswordRequestForm = Depends(),db: Session = Depends(database.query_db)):
+def reverse_backup(archive: str = None, form_data: OAuth2PasswordRequestForm = Depends(),
+                   db: Session = Depends(database.query_db)):
     user = db_tools.get_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     
-    # Get the sources where current model is stored
-    source_dir = list(Path('./src/models/archives/').interdir())[0]  # Take the first available file in archive
+    # Get the sources where the archived model is stored
+    archives_dir = Path('./src/models/archives/')
+    if archive is not None:
+        # Only a folder name returned by /backup is accepted (no path to elsewhere)
+        if Path(archive).name != archive or not (archives_dir / archive).is_dir():
+            raise HTTPException(status_code=404, detail=f"Archive {archive} not available in ./src/models/archives/")
+        source_dir = archives_dir / archive / 'trained_model.joblib'
+    else:
+        archives = [archive for archive in archives_dir.iterdir() if archive.is_dir()]
+        if not archives:
+            raise HTTPException(status_code=404, detail="No archived model available in ./src/models/archives/")
+        source_dir = max(archives, key=lambda archive: archive.stat().st_mtime) / 'trained_model.joblib'
     
-    # Create / use a path where to archive the current trained model
-    destination_dir = Path(f'./src/models/')
+    # Path of the current trained model
+    destination_dir = Path(predict_model.MODEL_PATH)
 
-    # Save in destination directory
-    shutil.copy(source_dir, destination_dir)
+    # Copy then swap the file so that the archive (possibly hard linked) and the mapped model stay untouched
+    tmp_path = destination_dir.with_suffix('.tmp')
+    shutil.copy2(source_dir, tmp_path)
+    os.replace(tmp_path, destination_dir)
 
+    # Serve predictions with the retrieved model
+    predict_model.loaded_model = predict_model.load_model()
@@ -3,7 +3,7 @@ Module used for modelling objects from sqlalchemy.orm
 Those objects can then easy get passed in the DB.
 """
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from typing import Optional
 from database import Role
 from enum import Enum
@@ -12,10 +12,10 @@ class userNew(BaseModel):
     """
     Scheme for any new user.
     """
-    username: str = Field(..., example="Bobby", min_length=4, description="Unique user name")
-    nickname: Optional[str] = Field(..., example="Bobby", min_length=4, description="Unique user name")
-    email: EmailStr = Field(..., example="Bobby@my_worl.com", description="Unique user e-mail")
-    password: str = Field(..., example="who is afraid of 6", min_length=6, description="User's password")
+    username: str = Field(..., examples=["Bobby"], min_length=4, description="Unique user name")
+    nickname: Optional[str] = Field(..., examples=["Bobby"], min_length=4, description="Unique user name")
+    email: EmailStr = Field(..., examples=["Bobby@my_worl.com"], description="Unique user e-mail")
+    password: str = Field(..., examples=["who is afraid of 6"], min_length=6, description="User's password")
     role: Role = Field(..., description="User's role")
 
 
@@ -23,12 +23,24 @@ class userInDB(userNew):
     """
     Scheme for any existing user in DB
     """
-    id: int = Field(..., example=1, description="User's unique ID")
-    is_active: bool = Field(..., example=True, description="User's status : active / inactive")
+    id: int = Field(..., examples=[1], description="User's unique ID")
+    is_active: bool = Field(..., examples=[True], description="User's status : active / inactive")
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
         
+class userOut(BaseModel):
+    """
+    Scheme of an existing user returned by the API (without any password).
+    """
+    id: int = Field(..., examples=[1], description="User's unique ID")
+    username: str = Field(..., examples=["Bobby"], description="Unique user name")
+    nickname: Optional[str] = Field(None, examples=["Bobby"], description="User's nickname")
+    email: EmailStr = Field(..., examples=["Bobby@my_worl.com"], description="Unique user e-mail")
+    is_active: bool = Field(..., examples=[True], description="User's status : active / inactive")
+    role: Role = Field(..., description="User's role")
+
+    model_config = ConfigDict(from_attributes=True)
+
 class userCreateInDB(userNew):
     """
     Scheme to enter a new user into the DB.
@@ -41,7 +53,7 @@ class userUpdateInDB(BaseModel):
     Scheme to update any user in the DB.
     """
     username: Optional[str] = Field(None, description="New username")
-    nickname: Optional[str] = Field(None, example="Bobby", min_length=4, description="Unique user name")
+    nickname: Optional[str] = Field(None, examples=["Bobby"], min_length=4, description="Unique user name")
     email: Optional[EmailStr] = Field(None, description="New e-mail")
     is_active: Optional[bool] = Field(None, description="Enable or disable user account")
     password: Optional[str] = Field(None, description="New password")
@@ -53,5 +65,5 @@ class userDelete(BaseModel):
     """
     Scheme to delete a user in the DB.
     """
-    id: int = Field(..., example=1, description="User's unique ID | Primary key of user in the users table.")       
+    id: int = Field(..., examples=[1], description="User's unique ID | Primary key of user in the users table.")       
 
@@ -1,27 +1,56 @@
 """
 Module managing security purposes based on Oauth2"""
 
-from datetime import datetime, timedelta, timezone
-from jose import jwt, JWTError
-from passlib.context import CryptContext
-from dotenv import load_dotenv, dotenv_values
-import os
+from datetime import timedelta
+import jwt
+import bcrypt
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
+from sqlalchemy import select, bindparam
+from cachetools import TTLCache
+import threading
 import database
+from settings import get_settings
 
 
-# Load .env file variables to the current working environement.
-load_dotenv()
-
 # Create constants based on .env variables
-SECRET_KEY = os.getenv("SECRET_KEY")
+SECRET_KEY = get_settings().secret_key
+SECRET_KEY_BYTES = SECRET_KEY.encode() if SECRET_KEY is not None else None
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Default token lifetime when no expiration is supplied (15 minutes)
+_DEFAULT_TTL_SECONDS = 15 * 60
+
+# Hashing time targeted when the bcrypt cost factor is calibrated (seconds)
+BCRYPT_TARGET_TIME = (0.05, 0.1)
+
+def _calibrate_bcrypt_rounds(min_rounds: int = 10, max_rounds: int = 14):
+    """
+    Find the bcrypt cost factor whose hashing time on the current hardware falls within BCRYPT_TARGET_TIME.
 
-# Engine to hash passwords
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    ARGS:
+        - min_rounds (int): lowest cost factor accepted.
+        - max_rounds (int): highest cost factor tried.
+
+    RETURN: int
+        The highest cost factor hashing within the target time (min_rounds if even this one is slower).
+    """
+    rounds = min_rounds
+    for candidate in range(min_rounds, max_rounds + 1):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(candidate))
+        elapsed = time.perf_counter() - start
+        if elapsed > BCRYPT_TARGET_TIME[1]:
+            break
+        rounds = candidate
+        if elapsed >= BCRYPT_TARGET_TIME[0]:
+            break
+    return rounds
+
+# Cost factor of bcrypt password hashing (2^rounds iterations): BCRYPT_ROUNDS if set, calibrated otherwise
+_BCRYPT_ROUNDS = get_settings().bcrypt_rounds or _calibrate_bcrypt_rounds()
 
 def check_password(plain_password, hashed_password):
     """
@@ -34,12 +63,12 @@ def check_password(plain_password, hashed_password):
     RETURN: Boolean
         True if both are identical and False otherwise.
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
 
 
 def hash_password(plain_password):
     """
-    Hash a password using the password context.
+    Hash a password with bcrypt.
 
     ARGS:
         - plain_password (str): pasword entered by user
@@ -47,7 +76,7 @@ def hash_password(plain_password):
     RETURN: str
         hashed_password
     """
-    return pwd_context.hash(plain_password)
+    return bcrypt.hashpw(plain_password.encode(), bcrypt.gensalt(_BCRYPT_ROUNDS)).decode()
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
@@ -65,19 +94,22 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     RETURN: str
         Encoded JWT token containing the supplied data and an expiration mark.
     """
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    # Expiration as an integer epoch timestamp (accepted as is by JWT)
+    expire = int(time.time()) + (int(expires_delta.total_seconds()) if expires_delta else _DEFAULT_TTL_SECONDS)
+    encoded_jwt = jwt.encode({**data, "exp": expire}, SECRET_KEY_BYTES, algorithm=ALGORITHM)
     return encoded_jwt
 
 # Oauth2 engine 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_user_with_token(db: Session = Depends(database.query_db), token: str = Depends(oauth2_scheme)):
+# User search by username, built once so that its compiled form is cached
+_USER_BY_NAME_STMT = select(database.User).where(database.User.username == bindparam("u")).limit(1)
+
+# Tokens already verified: token -> (expiration timestamp, user id, username), to skip decoding and user search
+_verified_tokens = TTLCache(maxsize=10_000, ttl=60)
+_verified_tokens_lock = threading.Lock()
+
+def get_user_with_token(db: Session = Depends(database.query_db), token: str = Depends(oauth2_scheme)):
 
     """
     Get user details from databse if the provided token is valid and if the user exists:
@@ -106,16 +138,44 @@ async def get_user_with_token(db: Session = Depends(database.query_db), token: s
         detail="Unable to validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # Token already verified: get the user by primary key while the token is not expired
+    with _verified_tokens_lock:
+        verified = _verified_tokens.get(token)
+    # (the user must still be the one named in the token: ids can be reused and usernames changed)
+    if verified is not None:
+        expire, user_id, username = verified
+        if expire > time.time():
+            user = db.get(database.User, user_id)
+            if user is not None and user.username == username:
+                return user
+        with _verified_tokens_lock:
+            _verified_tokens.pop(token, None)
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY_BYTES, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-    except JWTError:
+    except jwt.PyJWTError:
         raise credentials_exception
     
-    # Find the user in table User if exists and take the first corresponding occurence.
-    user = db.query(database.User).filter(database.User.username == username).first()
+    # Find the user in table User if exists (username is unique).
+    user = db.execute(_USER_BY_NAME_STMT, {"u": username}).scalar_one_or_none()
     if user is None:
         raise credentials_exception
+    if "exp" in payload:
+        with _verified_tokens_lock:
+            _verified_tokens[token] = (payload["exp"], user.id, username)
     return user
+
+
+def forget_user_tokens(user_id: int):
+    """
+    Remove the verified tokens of a user from cache (after it has been updated or deleted).
+
+    ARGS:
+        - user_id (int): primary key of the user in table User.
+    """
+    with _verified_tokens_lock:
+        for token in [token for token, verified in _verified_tokens.items() if verified[1] == user_id]:
+            _verified_tokens.pop(token, None)
@@ -0,0 +1,38 @@
+"""
+Module gathering the API settings read from environment variables or from the .env file.
+"""
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """
+    Scheme of the API settings (environment variables take precedence over the .env file).
+    """
+    # .env is searched next to this module and in its parent folder whatever the working directory
+    # (the closest file wins), as load_dotenv() used to find it
+    model_config = SettingsConfigDict(
+        env_file=(Path(__file__).resolve().parent.parent / ".env", Path(__file__).resolve().parent / ".env"),
+        extra="ignore"
+    )
+
+    secret_key: Optional[str] = None
+    admin_username: Optional[str] = None
+    admin_email: Optional[str] = None
+    admin_password: Optional[str] = None
+    bcrypt_rounds: Optional[int] = None
+    sql_echo: bool = False
+
+
+@lru_cache
+def get_settings():
+    """
+    Read the settings once and return the same instance on any later call.
+
+    RETURN: Settings
+        The API settings.
+    """
+    return Settings()
@@ -0,0 +1,48 @@
+"""
+Shared set-up of the API unit tests: modules search path, test settings and an isolated database.
+"""
+import pytest
+import sys
+import os
+
+# Get the absolute paths of the API folder (app) and of the repository root
+app_folder_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+root_folder_path = os.path.abspath(os.path.join(app_folder_path, ".."))
+
+# Add them to modules search path, with src/data whose modules import each other by name
+for folder_path in (app_folder_path, root_folder_path, os.path.join(root_folder_path, "src", "data")):
+    if folder_path not in sys.path:
+        sys.path.insert(0, folder_path)
+
+# Use bcrypt's lowest cost factor: skips its start-up calibration and makes any hashing in tests cheap
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import database
+import db_tools
+import security_center
+from models import userCreateInDB
+
+# Build an empty in-memory database for each test and clear the caches it could fill
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    database.Base.metadata.create_all(engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    db_tools._users_cache.clear()
+    security_center._verified_tokens.clear()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+# Build a new user whose password and e-mail derive from its name
+@pytest.fixture
+def new_user():
+    def build(name):
+        return userCreateInDB(username=name, nickname=name, password=f"{name}_password", 
+                              email=f"{name}@test.com", role=database.Role.employee)
+    return build
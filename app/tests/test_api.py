@@ -0,0 +1,85 @@
+"""
+This module purpose is to test API functions when when launching the application.
+Tests are launched when push occurs in github or through the related git action.
+
+We import function from the API, mock them and test them asynchronously using pytest
+"""
+import pytest
+import os
+import numpy as np
+from unittest.mock import MagicMock, patch
+from fastapi import HTTPException, status
+import database
+from models import userNew
+from settings import get_settings
+
+# Mock the trained model loaded when importing the API: tests must not depend on a training run
+mock_model = MagicMock()
+with patch("joblib.load", return_value=mock_model):
+    from main import get_ping, predict, train
+from src.models import predict_model, train_model
+
+# Features file example shipped next to the model, found whatever the working directory
+TEST_FEATURES_PATH = os.path.join(os.path.dirname(predict_model.__file__), "test_features.json")
+
+# Read settings and build users once for the whole test session ################
+@pytest.fixture(scope="session")
+def admin_credentials():
+    # Grasp environment variables from .env file (defaults when no .env file is available)
+    settings = get_settings()
+    return {
+        "username": settings.admin_username or "admin",
+        "email": settings.admin_email or "admin@admin.com",
+        "password": settings.admin_password or "admin_password",
+    }
+
+#Define a valid user
+@pytest.fixture(scope="session")
+def valid_user(admin_credentials):
+    return userNew(username=admin_credentials["username"], nickname=admin_credentials["username"],
+                   password=admin_credentials["password"], email=admin_credentials["email"], 
+                   role=database.Role.admin)
+         
+# Define a user who is not allowed to get predictions
+@pytest.fixture(scope="session")
+def fake_user():
+    return userNew(username='username', nickname='username', password='username', 
+                   email='username@username.com', role=database.Role.employee)
+
+# Test that the API is open #######################################################
+async def test_get_ping():
+    result = await get_ping()
+    assert result == "API is working well"
+
+# Test that the admin can make a prediction #######################################
+def test_predict_valid_user(valid_user):
+    mock_model.predict.return_value = np.array([1])
+    result = predict(file_to_load_path=TEST_FEATURES_PATH,
+                     db=None,
+                     user=valid_user)
+    assert result.status_code == 200
+    assert result.body == b'{"prediction":[1]}'
+
+# Test that a fake user cannot access to predictions and that a wrong file is refused
+@pytest.mark.parametrize("file_to_load_path, user_fixture, expected_status", [
+    (TEST_FEATURES_PATH, "fake_user", status.HTTP_403_FORBIDDEN),
+    ('dummy_path', "valid_user", status.HTTP_404_NOT_FOUND),
+])
+def test_predict_refused(request, file_to_load_path, user_fixture, expected_status):
+    with pytest.raises(HTTPException) as exc:
+        predict(file_to_load_path=file_to_load_path,
+                db=None,
+                user=request.getfixturevalue(user_fixture))
+    assert exc.value.status_code == expected_status
+
+# Test that a retrained model is served right after training ######################################
+def test_train_reloads_model(valid_user, monkeypatch):
+    new_model = MagicMock()
+    monkeypatch.setattr(predict_model, "loaded_model", mock_model)
+    monkeypatch.setattr(train_model, "train", MagicMock())
+    monkeypatch.setattr("main.db_tools.get_user", MagicMock(return_value=valid_user))
+    form_data = MagicMock(username=valid_user.username, password=valid_user.password)
+    with patch("joblib.load", return_value=new_model):
+        train(form_data=form_data, db=None)
+    train_model.train.assert_called_once()
+    assert predict_model.loaded_model is new_model
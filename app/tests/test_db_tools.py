@@ -0,0 +1,62 @@
+"""
+This module purpose is to test users management in the database (creation, search, update and deletion).
+
+Tests run on an in-memory database so that the application database is never modified.
+"""
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+import database
+import db_tools
+import models
+
+# Test that users are imported by batches in a single transaction ################################
+def test_bulk_create_users(db, new_user, monkeypatch):
+    monkeypatch.setattr(db_tools, "BULK_INSERT_BATCH_SIZE", 2)
+    ids = db_tools.bulk_create_users(db, [new_user(name) for name in ("alice", "bobby", "carol")])
+    assert len(ids) == 3
+    assert sorted(user["username"] for user in db_tools.get_all_users(db).values()) == ["alice", "bobby", "carol"]
+
+    # A conflict in the last batch cancels the whole import
+    with pytest.raises(HTTPException) as exc:
+        db_tools.bulk_create_users(db, [new_user(name) for name in ("david", "edgar", "alice")])
+    assert exc.value.status_code == 400
+    assert len(db_tools.get_all_users(db)) == 3
+
+# Test that get_user serves users from cache until they are forgotten ##############################
+def test_get_user_cache(db, new_user):
+    db_tools.create_user(db, new_user("alice"))
+    assert db_tools.get_user(db, "alice", "alice_password").email == "alice@test.com"
+
+    # A change made behind db_tools' back is not seen while the user is cached
+    db.execute(update(database.User).where(database.User.username == "alice").values(email="new@test.com"))
+    db.commit()
+    assert db_tools.get_user(db, "alice", "alice_password").email == "alice@test.com"
+
+    db_tools._forget_user("alice")
+    assert db_tools.get_user(db, "alice", "alice_password").email == "new@test.com"
+    with pytest.raises(HTTPException) as exc:
+        db_tools.get_user(db, "alice", "wrong_password")
+    assert exc.value.status_code == 404
+
+# Test that a user is updated or deleted either by its id or by its username #####################
+@pytest.mark.parametrize("by_id", [True, False])
+def test_update_and_delete_user(db, new_user, by_id):
+    alice = db_tools.create_user(db, new_user("alice"))
+    identifier = str(alice.id) if by_id else "alice"
+
+    updated = db_tools.update_user(db, identifier, models.userUpdateInDB(email="alice@new.com", password="new_password"))
+    assert updated["username"] == "alice"
+    assert updated["email"] == "alice@new.com"
+    assert "password" not in updated and "hashed_password" not in updated
+    assert db_tools.get_user(db, "alice", "new_password").email == "alice@new.com"
+
+    deleted = db_tools.delete_user(db, identifier)
+    assert deleted["user"]["id"] == alice.id
+    assert db_tools.find_user(db, "alice") is None
+
+    # An unknown identifier is reported as such
+    for function, args in ((db_tools.update_user, (models.userUpdateInDB(),)), (db_tools.delete_user, ())):
+        with pytest.raises(HTTPException) as exc:
+            function(db, identifier, *args)
+        assert exc.value.status_code == 404
@@ -0,0 +1,42 @@
+"""
+This module purpose is to test the security helpers: bcrypt cost calibration and token verification.
+"""
+import pytest
+from datetime import timedelta
+from unittest.mock import patch
+from fastapi import HTTPException
+import db_tools
+import security_center
+
+# Test that the calibration keeps the first cost factor hashing within the target time ##########
+@pytest.mark.parametrize("elapsed_times, expected_rounds", [
+    ([0.01, 0.03, 0.07], 12),          # 12 rounds reach the target time
+    ([0.01, 0.03, 0.2], 11),           # 12 rounds are too slow: keep the previous one
+    ([0.2], 10),                       # Even the lowest cost factor is too slow: keep it
+    ([0.001] * 5, 14),                 # Hardware too fast to reach the target: keep the highest one
+])
+def test_calibrate_bcrypt_rounds(elapsed_times, expected_rounds):
+    # perf_counter is read before and after each hashing
+    clock = [t for elapsed in elapsed_times for t in (0.0, elapsed)]
+    with patch("security_center.bcrypt.hashpw"), patch("security_center.time.perf_counter", side_effect=clock):
+        assert security_center._calibrate_bcrypt_rounds(min_rounds=10, max_rounds=14) == expected_rounds
+
+# Test that a verified token is cached, bound to its username and forgotten on request ############
+def test_token_cache(db, new_user, monkeypatch):
+    monkeypatch.setattr(security_center, "SECRET_KEY_BYTES", b"test_secret_key_of_at_least_32_bytes")
+    alice = db_tools.create_user(db, new_user("alice"))
+    token = security_center.create_access_token({"sub": "alice"}, expires_delta=timedelta(minutes=5))
+
+    assert security_center.get_user_with_token(db, token).id == alice.id
+    assert token in security_center._verified_tokens
+    security_center.forget_user_tokens(alice.id)
+    assert token not in security_center._verified_tokens
+
+    # Once the user is renamed, the cached token no longer matches it and is refused
+    assert security_center.get_user_with_token(db, token).id == alice.id
+    alice.username = "alicia"
+    db.commit()
+    with pytest.raises(HTTPException) as exc:
+        security_center.get_user_with_token(db, token)
+    assert exc.value.status_code == 401
+    assert token not in security_center._verified_tokens
@@ -4,8 +4,15 @@ import pandas as pd
 import sys
 import json
 
+MODEL_PATH = "./src/models/trained_model.joblib"
+
+def load_model(path=MODEL_PATH):
+    # Memory-map the numpy arrays stored in the file instead of reading them.
+    # Sklearn trees copy their node arrays when unpickled: a RandomForest is still held in memory by each worker.
+    return joblib.load(path, mmap_mode='r')
+
 # Load your saved model
-loaded_model = joblib.load("./src/models/trained_model.joblib")
+loaded_model = load_model()
 
 def predict_model(features):
     input_df = pd.DataFrame([features])
@@ -4,6 +4,7 @@ import pandas as pd
 from sklearn import ensemble
 import joblib
 import numpy as np
+import os
 
 print(joblib.__version__)
 
@@ -21,6 +22,8 @@ def train():
   rf_classifier.fit(X_train, y_train)
 
   #--Save the trained model to a file
+  #--Write a temporary file then swap it so that archived hard links to the previous model stay untouched
   model_filename = './src/models/trained_model.joblib'
-  joblib.dump(rf_classifier, model_filename)
+  joblib.dump(rf_classifier, model_filename + '.tmp')
+  os.replace(model_filename + '.tmp', model_filename)
   print("Model trained and saved successfully.")
@@ -11,16 +11,30 @@ from airflow.utils.trigger_rule import TriggerRule
 from airflow.utils.dates import days_ago
 from datetime import datetime as dt, timedelta
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
 import shutil  # Manage files. See: https://docs.python.org/3/library/shutil.html
 from pathlib import Path
-
-# Retrieve environement variables with Airflow get() dedicated function
-admin_username = Variable.get("admin_username")
-admin_password = Variable.get("admin_password")
-api_url = Variable.get("api_url")
-current_accuracy = Variable.get("current_accuracy")
-accuracy_threshold = Variable.get("accuracy_threshold")
+from functools import lru_cache
+
+# Retrieve environement variables with Airflow get() dedicated function.
+# Variables are read lazily inside tasks (not each time the scheduler parses this file)
+# and only once per process.
+@lru_cache(maxsize=None)
+def get_variable(key, default_var=None):
+    return Variable.get(key, default_var=default_var)
+
+# HTTP session shared by the tasks: keeps connections to the API alive between requests
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=3, backoff_factor=0.5))
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+# (connect, read) timeouts in seconds so that a hung API call does not hold a worker slot forever.
+# Data import/processing and training run synchronously on the API side: they get a longer read timeout.
+REQUEST_TIMEOUT = (3.05, 30)
+LONG_REQUEST_TIMEOUT = (3.05, 3600)
 
 ########################################                              
 # Define a DAG to play the workflow
@@ -56,27 +70,25 @@ dag = DAG(
 
     ## DETAILED TASKS ##############
     - TASK 'get_jwt_token' (t1)
-      Grasp a token and store it in a Xcom variable.
+      Grasp a token and store it in a Xcom variable (returned value).
 
     - TASK 'recharge_data' (t2)
       Reload data: import raw data and make dataset with the latest available data.
 
     - TASK 'Check_accuracy' (t3)
       Compute model accuracy on the new dataset (new X_test and y_test) and compare to acceptance threshold.
-      If accuracy is under threshold => 'backup' current model and 'retrain' model and save it
+      If accuracy is under threshold => 'backup_retrain_validate'
       Otherwise => 'nope' do nothing
     
-    - TASK 'backup' (t4_1)
-      Save the current model in archives with a timestamp.
+    - TASK 'backup_retrain_validate' (t4_1)
+      Runs the three following steps in a single task:
+        - backup: save the current model in archives with a timestamp,
+        - retrain: retrain the model and store it as the new current model,
+        - validate: compare new accuracy vs. backup model accuracy and revert models if the new model shows a weaker accuracy.
+      The task stops as soon as a step fails, and it is never retried: the model is restored from the archive made in the same run.
 
     - TASK 'nope' (t4_2)
       Do nothing.
-
-    - TASK 'retrain' (t5)
-      Retrain the model and store it as the new current model.
-    
-    - TASK 'validate' (t6)
-      Compare new accuracy vs. backup model accuracy and revert models if the new model shows a weaker accuracy.
       
     - TASK 'email_success' (t7_1)
       Send an email if the new model accuracy is better. 
@@ -97,52 +109,58 @@ dag = DAG(
 )
 
 def get_jwt_token(**kwargs):
-    ti = kwargs['ti']
-
+    api_url = get_variable("api_url")
     token_url = f"{api_url}/token"
     data = {
         "grant_type": "password",
-        "username": admin_username,
-        "password": admin_password,
+        "username": get_variable("admin_username"),
+        "password": get_variable("admin_password"),
     }
     headers = {
         "Content-Type": "application/x-www-form-urlencoded"
     }
-    response = requests.post(token_url, data=data, headers=headers)
+    response = SESSION.post(token_url, data=data, headers=headers, timeout=REQUEST_TIMEOUT)
     if response.status_code == 200:
-        # Return the token and add it to Variable:
+        # Return the token: PythonOperator stores it once in XCom (key 'return_value')
         token = response.json().get("access_token")
-        ti.xcom_push(key='token', value=(token))
         return token
     else:
-        logging.error(f"Error obtaining JWT token: {response.status_code}, {response.text}")
+        logging.error(f"Error obtaining JWT token: {response.status_code}, {response.text[:512]}")
         return None
 
 def recharge_data(**kwargs):
     ti = kwargs['ti']
 
-    token = ti.xcom_pull(task_ids='get_jwt_token', key='token')
+    token = ti.xcom_pull(task_ids='get_jwt_token')
 
+    api_url = get_variable("api_url")
     raw_url = f"{api_url}/raw"
     dataset_url = f"{api_url}/dataset"
     
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
+    SESSION.headers.update({"Authorization": f"Bearer {token}"})
 
-    # Execute requests to import and process raw data
-    resp_raw = requests.post(raw_url, headers=headers)
-    resp_dataset = requests.post(dataset_url, headers=headers)
+    # Execute requests to import and process raw data.
+    # The dataset is built from the imported raw data: both calls stay sequential
+    # (on the same kept-alive connection) and processing is skipped if the import failed.
+    resp_raw = SESSION.post(raw_url, timeout=LONG_REQUEST_TIMEOUT)
 
     if resp_raw.status_code == 200:
         logging.info("Raw data have been imported with success.")
     else:
-        logging.error(f"Error when importing raw data: {resp_raw.status_code}, {resp_raw.text}")
+        logging.error(f"Error when importing raw data: {resp_raw.status_code}, {resp_raw.text[:512]}")
+        return
+
+    resp_dataset = SESSION.post(dataset_url, timeout=LONG_REQUEST_TIMEOUT)
 
     if resp_dataset.status_code == 200:
         logging.info("Data have been processed with success and are saved in folder: ./data/preprocessed.")
     else:
-        logging.error(f"Error when processing raw data: {resp_dataset.status_code}, {resp_dataset.text}")
+        logging.error(f"Error when processing raw data: {resp_dataset.status_code}, {resp_dataset.text[:512]}")
+
+def parse_accuracy(resp_accuracy):
+    # Raise if the API failed, otherwise convert its score (between 0 and 1) into % as the thresholds
+    resp_accuracy.raise_for_status()
+    return 100 * float(resp_accuracy.json()["accuracy"])
 
 def nope():
     pass
@@ -150,123 +168,112 @@ def nope():
 def Check_accuracy(**kwargs):
     ti = kwargs['ti']
 
-    token = ti.xcom_pull(task_ids='get_jwt_token', key='token')
+    token = ti.xcom_pull(task_ids='get_jwt_token')
 
+    api_url = get_variable("api_url")
     accuracy_url = f"{api_url}/accuracy"
     
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
+    SESSION.headers.update({"Authorization": f"Bearer {token}"})
 
     # Get accuracy from fresh data with a new X_test set
-    resp_accuracy = requests.post(accuracy_url, headers=headers)
+    resp_accuracy = SESSION.get(accuracy_url, timeout=REQUEST_TIMEOUT)
+    if resp_accuracy.status_code != 200:
+        logging.error(f"Error while retrieveing accuracy: {resp_accuracy.status_code}, {resp_accuracy.text[:512]}")
+    accuracy = parse_accuracy(resp_accuracy)
 
     # Update accuracy in environment variable
-    ti.xcom_push(key='current_accuracy', value=(float(resp_accuracy)))
-    logging.info(f"Checking accuracy difference... Current accuracy: {resp_accuracy}")
+    ti.xcom_push(key='current_accuracy', value=accuracy)
+    logging.info(f"Checking accuracy difference... Current accuracy: {accuracy}")
     
-    accuracy_threshold = float(Variable.get("accuracy_threshold", default_var=85))
+    accuracy_threshold = float(get_variable("accuracy_threshold", default_var=85))
 
-    if resp_accuracy >= accuracy_threshold:
+    if accuracy >= accuracy_threshold:
         logging.info("Accuracy based on new data is above threshold then we do nothing.")
         return 'nope'
     else: 
         logging.info("Accuracy based on new data is under threshold thne we proceed to backup.")
-        return 'backup'
+        return 'backup_retrain_validate'
     
-def backup(**context):
-    ti = context['ti']
-
-    token = ti.xcom_pull(task_ids='get_jwt_token', key='token')
-
+def backup(api_url):
     backup_url = f"{api_url}/backup"
-    
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
 
-    # Backup current model
-    resp_backup = requests.post(backup_url, headers=headers)
+    # Backup current model: stop here if it failed, the model must not be retrained without a backup
+    resp_backup = SESSION.post(backup_url, timeout=REQUEST_TIMEOUT)
     
     if resp_backup.status_code == 200:
         logging.info("Current model has been saved as a backup with success.")
     else:
-        logging.error(f"Error when saving current model: {resp_backup.status_code}, {resp_backup.text}")
-
-def retrain(**context):
-    ti = context['ti']
+        logging.error(f"Error when saving current model: {resp_backup.status_code}, {resp_backup.text[:512]}")
+    resp_backup.raise_for_status()
 
-    token = ti.xcom_pull(task_ids='get_jwt_token', key='token')
+    # Name of the archive holding this backup
+    return resp_backup.json()["archive"]
 
+def retrain(api_url):
     # Routes
     train_url = f"{api_url}/train"
-    accuracy_url = f"{api_url}/accuracy"
-
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
 
-    # Retrain model
-    resp_train = requests.post(train_url, headers=headers)
+    # Retrain model: stop here if it failed, there is no new model to validate
+    resp_train = SESSION.post(train_url, timeout=LONG_REQUEST_TIMEOUT)
     
     if resp_train.status_code == 200:
         logging.info("Model has been trained and saved with success.")
     else:
-        logging.error(f"Error while training the model. Unable to save it: {resp_train.status_code}, {resp_train.text}")
-    
-    # Update model accuracy
-    resp_accuracy = requests.post(accuracy_url, headers=headers)
-    
-    if accuracy_url.status_code == 200:
-        ti.xcom_push(key='current_accuracy', value=(float(resp_accuracy)))
-        logging.info("Accuracy has been updated with success.")
-    else:
-        logging.error(f"Error while updating accuracy: {accuracy_url.status_code}, {accuracy_url.text}")
-
-def validate(**context):
-    ti = context['ti']
-
-    token = ti.xcom_pull(task_ids='get_jwt_token', key='token')
+        logging.error(f"Error while training the model. Unable to save it: {resp_train.status_code}, {resp_train.text[:512]}")
+    resp_train.raise_for_status()
 
+def validate(ti, api_url, archive):
     # Define routes url
     accuracy_url = f"{api_url}/accuracy"
     reverse_backup_url = f"{api_url}/reverse_backup"
-    
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
 
     # Get accuracy of the model
-    resp_accuracy = requests.post(accuracy_url, headers=headers)
+    resp_accuracy = SESSION.get(accuracy_url, timeout=REQUEST_TIMEOUT)
     
     # Check request success
     if resp_accuracy.status_code == 200:
         logging.info("Accuracy retrieved with success.")
     else:
-        logging.error(f"Error while retrieveing accuracy: {resp_accuracy.status_code}, {resp_accuracy.text}")
+        logging.error(f"Error while retrieveing accuracy: {resp_accuracy.status_code}, {resp_accuracy.text[:512]}")
+
+    accuracy = parse_accuracy(resp_accuracy)
 
     # Update accuracy in environment variable
-    ti.xcom_push(key='current_accuracy', value=(float(resp_accuracy.values.get("accuracy"))))
-    logging.info(f"Checking accuracy difference... Current accuracy: {resp_accuracy}")
+    ti.xcom_push(key='current_accuracy', value=accuracy)
+    logging.info(f"Checking accuracy difference... Current accuracy: {accuracy}")
     
-    accuracy_threshold = float(Variable.get("accuracy_threshold", default_var=85))
+    accuracy_threshold = float(get_variable("accuracy_threshold", default_var=85))
 
-    if float(resp_accuracy.values.get("accuracy")) >= accuracy_threshold:
+    if accuracy >= accuracy_threshold:
         logging.info("Accuracy of the new model is above the threshold then we keep the new model.")
         
         return 'email_success'
     else: 
         logging.info("Accuracy of the new model is under the threshold then we keep the current model.")
-        resp_accuracy = requests.post(accuracy_url, headers=headers)
-        logging.info(f"Reversing models... Retrieving current model.")
+        logging.info(f"Reversing models... Retrieving current model from archive {archive}.")
+        resp_reverse = SESSION.post(reverse_backup_url, params={"archive": archive}, timeout=REQUEST_TIMEOUT)
 
         # Check request success
-        if reverse_backup_url.status_code == 200:
+        if resp_reverse.status_code == 200:
             logging.info("Model reversed with success.")
         else:
-            logging.error(f"Error while reversing model: {reverse_backup_url.status_code}, {reverse_backup_url.text}")
+            logging.error(f"Error while reversing model: {resp_reverse.status_code}, {resp_reverse.text[:512]}")
 
         return 'email_failure'
+
+def backup_retrain_validate(**context):
+    # Sequential steps run in a single task: one token retrieval and no scheduling between steps
+    ti = context['ti']
+
+    token = ti.xcom_pull(task_ids='get_jwt_token')
+
+    api_url = get_variable("api_url")
+
+    SESSION.headers.update({"Authorization": f"Bearer {token}"})
+
+    archive = backup(api_url)
+    retrain(api_url)
+    return validate(ti, api_url, archive)
     
 ###############################################
 # TASKS DESCRIPTIUON
@@ -309,15 +316,18 @@ t3 = BranchPythonOperator(
     """
 )
 
-t4_1 = PythonOperator(
-    task_id='backup',
-    python_callable=backup,
-    trigger_rule=TriggerRule.ALL_SUCCESS,
+t4_1 = BranchPythonOperator(
+    task_id='backup_retrain_validate',
+    python_callable=backup_retrain_validate,
     dag=dag,
+    trigger_rule=TriggerRule.ALL_SUCCESS,
+    # Not retried: a retry would back up the retrained model again and restore it instead of the genuine one
+    retries=0,
     doc_md="""
-    ### `backup`
-    - **Type:** PythonOperator
-    - **Description:** Save current model as a backup.
+    ### `backup_retrain_validate`
+    - **Type:** BranchPythonOperator
+    - **Retries:** `0`
+    - **Description:** Save current model as a backup, retrain model and save it on current directory, then validate the new model or replace the genuine model. Send warning eamils in any case.
     """
 )
 
@@ -333,30 +343,6 @@ t4_2 = PythonOperator(
     """
 )
 
-t5 = PythonOperator(
-    task_id='retrain',
-    python_callable=retrain,
-    trigger_rule=TriggerRule.ALL_SUCCESS,
-    dag=dag,
-    doc_md="""
-    ### `retrain`
-    - **Type:** PythonOperator
-    - **Description:** Retrain model and save it on current directory.
-    """
-)
-
-t6 = BranchPythonOperator(
-    task_id='validate',
-    python_callable=validate,
-    dag=dag,
-    trigger_rule=TriggerRule.ALL_SUCCESS,
-    doc_md="""
-    ### `validate`
-    - **Type:** BranchPythonOperator
-    - **Description:** Validate the new model or replace the genuine model. Send warning eamils in any case.
-    """
-)
-
 t7_1 = EmailOperator(
     task_id='email_success',
     to='immocb@hotmail.com',
@@ -364,7 +350,7 @@ t7_1 = EmailOperator(
     html_content="""<h3>Model retraining succeeded</h3>
                     <p>Retraining information:</p>
                     <ul>
-                        <li>Accuracy of the model in production (reference): {{ Variable.get("accuracy_threshold", default_var=85) }}%</li>
+                        <li>Accuracy of the model in production (reference): {{ var.value.get("accuracy_threshold", 85) }}%</li>
                     </ul>
                     <p>Please see the logs for more details.</p>""",
     dag=dag,
@@ -382,7 +368,7 @@ t7_2 = EmailOperator(
     html_content="""<h3>Model retraining failed</h3>
                     <p>Model retraining failed during validation. Here are some details:</p>
                     <ul>
-                        <li>Accuracy of the model in production (reference): {{ Variable.get("accuracy_threshold", default_var=85) }}%</li>
+                        <li>Accuracy of the model in production (reference): {{ var.value.get("accuracy_threshold", 85) }}%</li>
                     </ul>
                     <p>Please check the logs and correct any identified issues.</p>""",
     dag=dag,
@@ -398,5 +384,5 @@ t7_2 = EmailOperator(
 # WORKFLOW DEPENDENCIES DESCRIPTION
 #################################################
 
-t_1 >> t_2 >> t_3 >> [t4_1, t4_2]
-t4_1 >> t5 >> t6 >> [t7_1, t7_2]
+t1 >> t2 >> t3 >> [t4_1, t4_2]
+t4_1 >> [t7_1, t7_2]